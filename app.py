@@ -12,19 +12,39 @@
 import serial
 import sqlite3
 import threading
+import queue
+from collections import deque
 import struct
+import functools
 import os
 import math 
 import google.generativeai as genai
 import time
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+import plotly.io as pio
 import dash
 import dash_bootstrap_components as dbc
-from dash import dcc, html, Input, Output, State
+from dash import dcc, html, Input, Output, State, Patch
+from dash.exceptions import PreventUpdate
 import json
+import re
 from datetime import datetime
 import logging
+import logging.handlers
+
+# orjson (opcional): parser JSON em Rust, mais rápido que o json da stdlib
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    json_loads = json.loads
+
+# O Dash serializa as respostas dos callbacks via plotly.io.json: usa orjson quando disponível
+if orjson is not None:
+    pio.json.config.default_engine = 'orjson'
 
 # =============================================================================
 # CONFIGURAÇÕES GERAIS E CONSTANTES
@@ -33,8 +53,46 @@ import logging
 # Configuração da Porta Serial (Verificar no Gerenciador de Dispositivos)
 COM_PORT = 'COM12' 
 BAUD_RATE = 9600
+# Folga entre comandos após o flush: cobre o pior caso do loop do firmware
+# (envio bloqueante do pacote de 13 bytes a 9600 baud ~14 ms + sleep de 1 ms)
+CMD_INTERVALO_SEG = 0.02
+# Timeout curto de leitura: mantém o laço serial responsivo para descarregar o lote no SQLite
+SERIAL_TIMEOUT_SEG = 0.05
+# Janela para agrupar comandos enfileirados antes de enviá-los
+TX_AGRUPA_SEG = 0.02
+# Eventos agendados: o FOTO vigente é reafirmado neste intervalo mesmo sem transição
+# (recupera um comando perdido ou um reinício do Pico, que volta com fotoperíodo desligado)
+FOTO_REENVIO_SEG = 3600
+
+# Layout do pacote binário (Big Endian): LDR, NTC, Umidade (uint16), LED (uint8), Luz acumulada (uint32)
+# Totaliza 11 bytes de payload, seguidos de checksum (1 byte) e finalizador 0xAA
+PKT_STRUCT = struct.Struct('>HHHBI')
+PKT_TAMANHO = PKT_STRUCT.size + 2
+PKT_FIM = 0xAA
+
 DB_FILE = 'minha_estufa.db'
 
+# Gravação em lote: descarrega a cada N leituras ou T segundos (o que vier primeiro)
+DB_BATCH_ROWS = 50
+DB_BATCH_SEG = 1.0
+# Apenas valores crus são gravados; a conversão física é feita vetorizada no Dash
+SQL_INSERT_READING = "INSERT INTO readings (timestamp, ldr_raw, ntc_raw, umidade_raw, led_status, luz_acumulada_s) VALUES "
+SQL_INSERT_LINHA = "(?,?,?,?,?,?)"
+# INSERT multi-linha: respeita o limite clássico de 999 parâmetros do SQLite (6 por linha)
+DB_MAX_LINHAS_INSERT = 999 // 6
+
+# Consulta do histórico: varredura por faixa no índice de timestamp, só com as colunas usadas
+JANELA_HISTORICO_MS = 600000
+MAX_LINHAS_HISTORICO = 5000
+SQL_SELECT_HISTORICO = """
+    SELECT timestamp, ldr_raw, temperature_c, ntc_raw, umidade_raw, umidade_percent, led_status, luz_acumulada_s
+    FROM readings WHERE timestamp > ? ORDER BY timestamp DESC LIMIT ?
+"""
+SQL_SELECT_ULTIMA = """
+    SELECT timestamp, ldr_raw, temperature_c, ntc_raw, umidade_raw, umidade_percent, led_status, luz_acumulada_s
+    FROM readings WHERE timestamp > ? ORDER BY timestamp DESC LIMIT 1
+"""
+
 # Parâmetros de Calibração dos Sensores
 # NTC 10k: Beta 3950, resistor divisor de 10k
 R_FIXO_NTC = 10000.0
@@ -51,6 +109,18 @@ ADC_MAX = 4095.0
 V_IN = 3.3
 LDR_LIMIAR_FIXO = 2000
 
+# Constantes derivadas (pré-calculadas uma vez, fora das funções de conversão)
+KELVIN = 273.15
+INV_T0_K = 1.0 / (TEMP_NOMINAL_C + KELVIN)
+INV_BETA = 1.0 / BETA_NTC
+INV_HUMID_B_100 = 100.0 / HUMID_B
+HUMID_B_POR_100 = HUMID_B / 100.0
+V_POR_LSB = V_IN / ADC_MAX
+LSB_POR_V = ADC_MAX / V_IN
+
+# Máximo de pontos por série enviados ao navegador (downsampling LTTB)
+MAX_PONTOS_GRAFICO = 500
+
 # =============================================================================
 # INTEGRAÇÃO COM IA (Google Gemini)
 # =============================================================================
@@ -62,27 +132,120 @@ except KeyError:
     print("Aviso: GOOGLE_API_KEY não encontrada. A IA não funcionará.")
     model = None
 
+# Cache das respostas da IA por planta (TTL), persistido em disco entre reinícios
+IA_CACHE_FILE = 'cache_ia.json'
+IA_CACHE_TTL_SEG = 86400
+IA_CACHE_MAX = 256
+# Remove as cercas de código markdown (```json ... ```) em uma única passada
+IA_FENCE = re.compile(r'```(?:json)?')
+IA_CAMPOS = ('umidade_ideal_percent', 'temperatura_ideal_celsius', 'fotoperiodo_horas', 'descricao')
+ia_cache_lock = threading.Lock()
+
+def load_ia_cache():
+    """Carrega o cache da IA do disco (vazio se ausente ou corrompido)."""
+    try:
+        with open(IA_CACHE_FILE, encoding='utf-8') as f:
+            dados = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(dados, dict): return {}
+    
+    # Descarta entradas fora do formato {'expira': número, 'dados': dict com IA_CAMPOS}
+    # e limita a validade ao TTL (arquivo editado à mão não cria entrada "eterna")
+    limite = time.time() + IA_CACHE_TTL_SEG
+    return {k: {'expira': min(v['expira'], limite), 'dados': v['dados']} for k, v in dados.items()
+            if isinstance(v, dict) and isinstance(v.get('expira'), (int, float)) and not isinstance(v.get('expira'), bool)
+            and isinstance(v.get('dados'), dict) and all(c in v['dados'] for c in IA_CAMPOS)}
+
+ia_cache = load_ia_cache()
+
+def ia_cache_get(key):
+    """Retorna a resposta em cache para a planta, ou None se ausente/expirada."""
+    with ia_cache_lock:
+        item = ia_cache.get(key)
+        if item and item['expira'] > time.time(): return item['dados']
+    return None
+
+def ia_cache_put(key, dados):
+    """Guarda a resposta, descarta expirados/excedentes e grava o arquivo."""
+    with ia_cache_lock:
+        agora = time.time()
+        ia_cache[key] = {'expira': agora + IA_CACHE_TTL_SEG, 'dados': dados}
+        for k in [k for k, v in ia_cache.items() if v['expira'] <= agora]: del ia_cache[k]
+        # Acima do limite, remove as entradas mais antigas
+        for k in sorted(ia_cache, key=lambda k: ia_cache[k]['expira'])[:max(0, len(ia_cache) - IA_CACHE_MAX)]: del ia_cache[k]
+        try:
+            tmp = IA_CACHE_FILE + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(ia_cache, f, ensure_ascii=False)
+            os.replace(tmp, IA_CACHE_FILE)
+        except OSError as e:
+            print(f"Aviso: falha ao gravar cache da IA: {e}")
+
 # =============================================================================
 # FUNÇÕES DE FÍSICA E MATEMÁTICA (Conversão ADC -> Unidade Real)
 # =============================================================================
 
+# Numba (opcional): compila as conversões para código nativo.
+# Sem Numba, os kernels rodam como Python puro e as versões em array usam NumPy.
+try:
+    from numba import njit
+    NUMBA_OK = True
+except ImportError:
+    def njit(*args, **kwargs):
+        return lambda f: f
+    NUMBA_OK = False
+
+# Flags fastmath sem 'nnan'/'ninf': os kernels precisam detectar NaN (linhas sem leitura)
+FASTMATH = {'arcp', 'contract', 'afn', 'reassoc', 'nsz'}
+
+@njit(cache=True, fastmath=FASTMATH)
+def _temp_ntc_kernel(adc):
+    """Equação Beta para uma leitura; devolve NaN se inválida."""
+    if adc > 4050 or adc <= 0: return np.nan # Sensor desconectado ou curto
+    
+    v_out = adc * V_POR_LSB
+    r_ntc = (v_out * R_FIXO_NTC) / (V_IN - v_out)
+    
+    # Equação Beta
+    ln_r = math.log(r_ntc / R_NOMINAL_NTC)
+    t_kelvin = 1.0 / (INV_T0_K + INV_BETA * ln_r)
+    t_c = t_kelvin - KELVIN
+    
+    return t_c if (-10 <= t_c <= 80) else np.nan
+
+@njit(cache=True, fastmath=FASTMATH)
+def _humidity_kernel(y):
+    """Curva inversa do sensor capacitivo para uma leitura; NaN permanece NaN."""
+    if y != y: return np.nan
+    if y <= 0: return 100.0
+    if y >= HUMID_A: return 0.0
+    
+    x = math.log(y / HUMID_A) * INV_HUMID_B_100
+    return max(0.0, min(100.0, x))
+
+@njit(cache=True, fastmath=FASTMATH)
+def _temp_ntc_batch(adc):
+    out = np.empty(adc.shape[0])
+    for i in range(adc.shape[0]):
+        out[i] = _temp_ntc_kernel(adc[i])
+    return out
+
+@njit(cache=True, fastmath=FASTMATH)
+def _humidity_batch(y):
+    out = np.empty(y.shape[0])
+    for i in range(y.shape[0]):
+        out[i] = _humidity_kernel(y[i])
+    return out
+
 def calculate_temp_ntc(adc_raw):
     """
     Converte leitura crua do ADC em Temperatura (°C)
     Utiliza a equação Beta simplificada (Steinhart-Hart).
     """
     try:
-        if adc_raw > 4050: return None # Sensor desconectado ou curto
-        
-        v_out = (adc_raw * V_IN) / ADC_MAX
-        r_ntc = (v_out * R_FIXO_NTC) / (V_IN - v_out)
-        
-        # Equação Beta
-        ln_r = math.log(r_ntc / R_NOMINAL_NTC)
-        t_kelvin = 1.0 / ((1.0/(TEMP_NOMINAL_C + 273.15)) + (1.0/BETA_NTC) * ln_r)
-        t_c = t_kelvin - 273.15
-        
-        return None if (t_c < -10 or t_c > 80) else t_c
+        t_c = _temp_ntc_kernel(float(adc_raw))
+        return None if math.isnan(t_c) else t_c
     except: 
         return None 
 
@@ -92,33 +255,98 @@ def calculate_humidity_percent(adc_raw):
     Baseado na calibração experimental (fórmula inversa).
     """
     try:
-        y = float(adc_raw)
-        if y <= 0: return 100.0
-        if y >= HUMID_A: return 0.0
-        
-        x = math.log(y / HUMID_A) / HUMID_B
-        return max(0.0, min(100.0, x * 100.0))
+        x = _humidity_kernel(float(adc_raw))
+        return None if math.isnan(x) else x
     except: 
         return None
 
+def calculate_temp_ntc_array(adc_raw):
+    """
+    Versão vetorizada de calculate_temp_ntc (Numba ou NumPy).
+    Recebe um array de leituras cruas e devolve °C, com NaN nas inválidas.
+    """
+    adc = np.ascontiguousarray(adc_raw, dtype=np.float64)
+    if NUMBA_OK: return _temp_ntc_batch(adc)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        v_out = adc * V_POR_LSB
+        r_ntc = (v_out * R_FIXO_NTC) / (V_IN - v_out)
+        ln_r = np.log(r_ntc / R_NOMINAL_NTC)
+        t_c = 1.0 / (INV_T0_K + INV_BETA * ln_r) - KELVIN
+    
+    # Mesmos critérios de descarte da versão escalar (NaN também cai aqui)
+    invalido = (adc > 4050) | ~(t_c >= -10) | ~(t_c <= 80)
+    return np.where(invalido, np.nan, t_c)
+
+def calculate_humidity_percent_array(adc_raw):
+    """
+    Versão vetorizada de calculate_humidity_percent (Numba ou NumPy).
+    Leituras ausentes (NaN) permanecem NaN.
+    """
+    y = np.ascontiguousarray(adc_raw, dtype=np.float64)
+    if NUMBA_OK: return _humidity_batch(y)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.log(y / HUMID_A) * INV_HUMID_B_100
+    x = np.where(y <= 0, 100.0, np.where(y >= HUMID_A, 0.0, x))
+    return np.clip(x, 0.0, 100.0)
+
+# Aquece os kernels na importação (compila ou carrega do cache em disco)
+if NUMBA_OK:
+    calculate_temp_ntc_array(np.array([2048.0]))
+    calculate_humidity_percent_array(np.array([2048.0]))
+
 def calculate_humidity_setpoint_raw(perc):
     """Converte setpoint do usuário (%) para valor RAW esperado pelo MCU."""
     try: 
-        return int(max(0, min(4095, HUMID_A * math.exp(HUMID_B * (perc / 100.0)))))
+        return int(max(0, min(4095, HUMID_A * math.exp(HUMID_B_POR_100 * perc))))
     except: 
         return 3000 
 
 def calculate_temp_setpoint_raw(temp_c):
     """Converte setpoint do usuário (°C) para valor RAW esperado pelo MCU."""
     try:
-        t_k = temp_c + 273.15
-        t0_k = TEMP_NOMINAL_C + 273.15
-        r_ntc = R_NOMINAL_NTC * math.exp(((1.0/t_k) - (1.0/t0_k)) * BETA_NTC)
+        t_k = temp_c + KELVIN
+        r_ntc = R_NOMINAL_NTC * math.exp(((1.0/t_k) - INV_T0_K) * BETA_NTC)
         v_out = (r_ntc * V_IN) / (R_FIXO_NTC + r_ntc)
-        return int(max(0, min(4095, (v_out * ADC_MAX) / V_IN)))
+        return int(max(0, min(4095, v_out * LSB_POR_V)))
     except: 
         return 1600
 
+# =============================================================================
+# DOWNSAMPLING (Redução de pontos para o gráfico histórico)
+# =============================================================================
+
+def lttb_indices(x, y, n_out):
+    """
+    Downsampling Largest-Triangle-Three-Buckets (LTTB).
+    Retorna os índices dos pontos que preservam a forma visual da série,
+    sempre incluindo o primeiro e o último ponto.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    # n_out-2 buckets entre o primeiro e o último ponto
+    bordas = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    
+    a = 0
+    for i in range(n_out - 2):
+        ini, fim = bordas[i], bordas[i+1]
+        # Vértice C do triângulo: média do bucket seguinte (ou o último ponto)
+        if i < n_out - 3:
+            c_x = x[fim:bordas[i+2]].mean()
+            c_y = y[fim:bordas[i+2]].mean()
+        else:
+            c_x, c_y = x[-1], y[-1]
+        
+        area = np.abs((x[a] - c_x) * (y[ini:fim] - y[a]) - (x[a] - x[ini:fim]) * (c_y - y[a]))
+        a = ini + int(np.argmax(area))
+        idx[i+1] = a
+    return idx
+
 # =============================================================================
 # CAMADA DE DADOS (SQLite)
 # =============================================================================
@@ -133,69 +361,188 @@ def init_db():
                 timestamp INTEGER, 
                 ldr_raw INTEGER, 
                 temperature_c REAL,
+                ntc_raw INTEGER, 
                 umidade_raw INTEGER, 
                 umidade_percent REAL,
                 led_status INTEGER, 
                 luz_acumulada_s INTEGER
             )
         ''')
+        # Migração: bancos antigos não possuem a coluna ntc_raw
+        cols = [c[1] for c in con.execute("PRAGMA table_info(readings)")]
+        if 'ntc_raw' not in cols:
+            con.execute("ALTER TABLE readings ADD COLUMN ntc_raw INTEGER")
+        # Índice para a consulta por janela de tempo do dashboard
+        con.execute("CREATE INDEX IF NOT EXISTS idx_ts ON readings(timestamp)")
         con.commit()
         con.close()
     except Exception as e: 
         print(f"Erro BD: {e}")
 
+# Conexão de leitura compartilhada pelos callbacks do Dash (servidor multi-thread)
+read_con = None
+read_lock = threading.Lock()
+
+def get_read_con():
+    """
+    Retorna a conexão somente-leitura do Dash, aberta uma única vez.
+    Deve ser usada com read_lock adquirido.
+    """
+    global read_con
+    if read_con is None:
+        read_con = sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True, check_same_thread=False)
+    return read_con
+
 # =============================================================================
 # THREAD DE COMUNICAÇÃO SERIAL (Backend)
 # =============================================================================
 
+# Última leitura decodificada (valores crus), escrita pela thread serial.
+# update() e dict() são operações únicas sob o GIL, então o leitor vê um estado consistente.
+LATEST = {}
+
+# Histórico recente em memória (ts_ms, ldr, ntc, hum, led, acc, temp_c, hum_p), valores crus.
+# temp_c/hum_p só vêm preenchidos em linhas antigas do banco (sem valor cru); nas demais são NaN.
+# Cobre a janela do gráfico (600 leituras a 1 Hz); o banco fica só para persistência.
+HIST = deque(maxlen=1024)
+HIST_LOCK = threading.Lock()
+
+# Logger da recepção serial (handlers configurados na inicialização)
+rx_log = logging.getLogger('estufa.rx')
+
+@functools.lru_cache(maxsize=None)
+def sql_insert_multi(n_linhas):
+    """Monta (e memoriza) o INSERT ... VALUES (...),(...) para n_linhas leituras."""
+    return SQL_INSERT_READING + ",".join([SQL_INSERT_LINHA] * n_linhas)
+
 def read_from_pico(ser): 
     """
     Worker Thread: Monitora a porta serial continuamente.
-    Lê pacotes binários de 13 bytes, valida checksum e salva no SQLite.
+    Lê pacotes binários de 13 bytes, valida finalizador e checksum e salva os valores crus no SQLite.
+    Em caso de pacote inválido, ressincroniza deslizando a janela byte a byte.
     Isso roda em paralelo para não travar a interface Dash.
+    As leituras são agrupadas em lotes (DB_BATCH_ROWS ou DB_BATCH_SEG)
+    e gravadas numa única transação com um INSERT multi-linha, evitando um fsync por pacote.
     """
     # SQLite precisa de conexão própria por thread
     db_con = sqlite3.connect(DB_FILE, check_same_thread=False)
+    # WAL permite leitura concorrente pelo Dash enquanto esta thread escreve
+    db_con.executescript("PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA temp_store=MEMORY; PRAGMA cache_size=-8000;")
     print(">>> Thread de Leitura Serial Iniciada")
     
+    # Semeia o histórico em memória com a janela já gravada (ex: após reinício do app)
+    try:
+        rows = db_con.execute(SQL_SELECT_HISTORICO, (int(time.time()*1000)-JANELA_HISTORICO_MS, MAX_LINHAS_HISTORICO)).fetchall()
+    except sqlite3.Error as e:
+        rx_log.error("[ERRO] Falha ao carregar histórico do banco: %s", e)
+        rows = []
+    with HIST_LOCK:
+        for ts, ldr, temp_c, ntc, hum, hum_p, led, acc_luz in reversed(rows):
+            # Linhas antigas não têm ntc_raw: mantém o valor já convertido gravado no banco
+            HIST.append((ts, ldr, ntc, hum, led, acc_luz, temp_c, hum_p))
+    
+    buf = []
+    last_flush = time.monotonic()
+    rx = bytearray() # Bytes recebidos do pacote corrente
+    sincronizado = True
+    
     while True:
         try:
-            # Protocolo: Aguarda byte 0xAA (Final de pacote)
-            packet = ser.read_until(b'\xAA')
+            # Leitura de tamanho fixo: retorna assim que o pacote completa (ou no timeout curto).
+            # Bytes parciais ficam em rx e são completados na próxima volta.
+            rx += ser.read(PKT_TAMANHO - len(rx))
             
-            # Validação do Tamanho do Pacote (definido no firmware C)
-            if len(packet) == 13: 
-                # Cálculo de Checksum (Soma dos primeiros 11 bytes)
-                chk = (sum(packet[0:11])) & 0xFF
+            if len(rx) == PKT_TAMANHO: 
+                # Validação do Finalizador e do Checksum (Soma dos primeiros 11 bytes, sem cópia)
+                with memoryview(rx) as mv:
+                    chk = sum(mv[:PKT_STRUCT.size]) & 0xFF
+                    valido = mv[-1] == PKT_FIM and chk == mv[PKT_STRUCT.size]
                 
-                # Validação de Integridade
-                if chk == packet[11]: 
-                    # Decodificação Big Endian (MSB primeiro)
-                    ldr = (packet[0]<<8) | packet[1]
-                    ntc = (packet[2]<<8) | packet[3]
-                    hum = (packet[4]<<8) | packet[5]
-                    led = packet[6] 
-                    # Luz acumulada é um uint32 (4 bytes)
-                    acc_luz = (packet[7]<<24) | (packet[8]<<16) | (packet[9]<<8) | packet[10] 
+                if valido: 
+                    # Decodificação Big Endian (MSB primeiro) numa única chamada em C
+                    ldr, ntc, hum, led, acc_luz = PKT_STRUCT.unpack_from(rx, 0)
+                    rx.clear()
+                    sincronizado = True
                     
-                    # Conversão física
-                    temp_c = calculate_temp_ntc(ntc)
-                    hum_p = calculate_humidity_percent(hum)
+                    now = int(time.time()*1000)
+                    # Publica a leitura mais recente em memória para os gauges do Dash
+                    LATEST.update(ts=now, ldr=ldr, ntc=ntc, hum=hum, led=led, acc=acc_luz)
+                    with HIST_LOCK:
+                        HIST.append((now, ldr, ntc, hum, led, acc_luz, np.nan, np.nan))
                     
-                    if temp_c is not None and hum_p is not None:
-                        # Persistência
-                        db_con.execute(
-                            "INSERT INTO readings (timestamp, ldr_raw, temperature_c, umidade_raw, umidade_percent, led_status, luz_acumulada_s) VALUES (?,?,?,?,?,?,?)", 
-                            (int(time.time()*1000), ldr, temp_c, hum, hum_p, led, acc_luz)
-                        )
-                        db_con.commit()
-                        print(f"[RX] LDR:{ldr} | T:{temp_c:.1f}°C | H:{hum_p:.1f}% | LED:{led} | Luz:{acc_luz}s")
+                    # Persistência (acumula no lote). Conversão física fica no Dash.
+                    buf.append((now, ldr, ntc, hum, led, acc_luz))
+                    # Log por pacote só quando DEBUG está ativo (evita formatação e I/O no laço)
+                    if rx_log.isEnabledFor(logging.DEBUG):
+                        rx_log.debug("[RX] LDR:%d | NTC:%d | H:%d | LED:%d | Luz:%ds", ldr, ntc, hum, led, acc_luz)
                 else:
-                    print(f"[ERRO] Checksum Inválido: Calc {chk} != Rec {packet[11]}")
+                    if sincronizado:
+                        rx_log.warning("[ERRO] Pacote Inválido (Calc %d != Rec %d, Fim %#04x): ressincronizando", chk, rx[PKT_STRUCT.size], rx[-1])
+                    sincronizado = False
+                    # Ressincronização: desliza a janela um byte e completa com read(1) na próxima volta
+                    del rx[0]
+            
+            # Descarrega o lote numa única transação (BEGIN...COMMIT)
+            if buf and (len(buf) >= DB_BATCH_ROWS or time.monotonic() - last_flush > DB_BATCH_SEG):
+                with db_con:
+                    for i in range(0, len(buf), DB_MAX_LINHAS_INSERT):
+                        lote = buf[i:i+DB_MAX_LINHAS_INSERT]
+                        db_con.execute(sql_insert_multi(len(lote)), [v for row in lote for v in row])
+                buf.clear()
+                last_flush = time.monotonic()
         except Exception as e: 
-            print(f"[ERRO CRÍTICO] Falha na Serial: {e}")
+            rx_log.error("[ERRO CRÍTICO] Falha na Serial: %s", e)
             time.sleep(5) # Espera antes de tentar reconectar
 
+# Fila de comandos para o firmware: callbacks só enfileiram, a thread de escrita envia
+TX_Q = queue.Queue()
+tx_log = logging.getLogger('estufa.tx')
+# Última falha de escrita ainda não mostrada na interface (lida por pop_tx_error)
+tx_error = None
+tx_error_lock = threading.Lock()
+
+def pop_tx_error():
+    """Retorna e limpa a última falha de escrita da serial (ou None)."""
+    global tx_error
+    with tx_error_lock:
+        erro, tx_error = tx_error, None
+    return erro
+
+def send_command(cmd):
+    """Enfileira um comando textual (ex: "SET,FOTO,1") para envio assíncrono."""
+    TX_Q.put(cmd.encode() + b"\n")
+
+def write_to_pico(ser):
+    """
+    Worker Thread: Drena TX_Q e envia os comandos pela serial.
+    Comandos que chegam juntos (até TX_AGRUPA_SEG) são agrupados, e repetições do
+    mesmo tipo (ex: dois SET,TEMP) são reduzidas ao valor mais recente.
+    """
+    global tx_error
+    while True:
+        pendentes = {}
+        msg = TX_Q.get()
+        try:
+            while True:
+                # Chave = comando sem o valor (SET,TEMP,1600 -> SET,TEMP)
+                key = msg.rsplit(b",", 1)[0] if msg.startswith(b"SET,") else msg
+                pendentes.pop(key, None)
+                pendentes[key] = msg
+                msg = TX_Q.get(timeout=TX_AGRUPA_SEG)
+        except queue.Empty:
+            pass
+        
+        try:
+            # O firmware guarda só um comando por vez (g_rx_buffer), então as linhas
+            # não podem ir num único write: espera a transmissão (flush) e dá uma folga curta
+            for msg in pendentes.values():
+                ser.write(msg); ser.flush()
+                time.sleep(CMD_INTERVALO_SEG)
+        except Exception as e:
+            tx_log.error("[ERRO] Falha ao enviar comandos: %s", e)
+            with tx_error_lock:
+                tx_error = f"{e}"
+
 # =============================================================================
 # FRONTEND DASHBOARD (Dash + Plotly)
 # =============================================================================
@@ -204,6 +551,29 @@ app = dash.Dash(__name__, external_stylesheets=[dbc.themes.CYBORG, 'https://font
 app.title = "Estufa Inteligente"
 CARD_STYLE = {"backgroundColor": "#2a2a2a", "color": "white"}
 
+# --- Figuras montadas uma única vez; os callbacks só enviam os dados via Patch ---
+def mk_gauge(val, min_v, max_v, col):
+    """Helper para criar Gauges (apenas o valor muda a cada atualização)."""
+    return go.Figure(go.Indicator(
+        mode="gauge+number", value=val, 
+        domain={'x':[0,1], 'y':[0,1]}, 
+        gauge={'axis':{'range':[min_v,max_v]}, 'bar':{'color':'white'}, 'steps':[{'range':[min_v, max_v], 'color':col}]}
+    )).update_layout(template="plotly_dark", height=200, margin=dict(l=20, r=20, t=20, b=20), paper_bgcolor='#2a2a2a')
+
+def mk_history_fig():
+    """Gráfico Multieixo (Temp, LDR, Umid) em WebGL, com as três séries vazias."""
+    fig = go.Figure(layout=go.Layout(template="plotly_dark", paper_bgcolor='#2a2a2a', plot_bgcolor='#2a2a2a'))
+    fig.add_trace(go.Scattergl(x=[], y=[], name='Temp', line=dict(color='red')))
+    fig.add_trace(go.Scattergl(x=[], y=[], name='LDR', line=dict(color='gold'), yaxis='y2'))
+    fig.add_trace(go.Scattergl(x=[], y=[], name='Umid', line=dict(color='deepskyblue'), yaxis='y3'))
+    
+    fig.update_layout(
+        yaxis=dict(title=dict(text='Temp (°C)', font=dict(color='red'))),
+        yaxis2=dict(title=dict(text='LDR', font=dict(color='gold')), overlaying='y', side='right'),
+        yaxis3=dict(title=dict(text='Umid (%)', font=dict(color='deepskyblue')), overlaying='y', side='right', position=0.95)
+    )
+    return fig
+
 # --- Layout da Página (Grid System Bootstrap) ---
 app.layout = dbc.Container(fluid=True, style={'backgroundColor': '#111111', 'color': 'white', 'padding': '20px', 'fontFamily': 'Roboto'}, children=[
     
@@ -211,13 +581,13 @@ app.layout = dbc.Container(fluid=True, style={'backgroundColor': '#111111', 'col
     dbc.Row(dbc.Col(html.H1("MONITORAMENTO ESTUFA IOT", className="text-center text-primary mb-4"))),
     
     # Gráfico Principal (Histórico)
-    dbc.Row(dbc.Col(dcc.Graph(id='main-graph')), className="mb-4"),
+    dbc.Row(dbc.Col(dcc.Graph(id='main-graph', figure=mk_history_fig())), className="mb-4"),
     
     # Cards de Indicadores Atuais (Gauges)
     dbc.Row([
-        dbc.Col(md=3, children=[dbc.Card(style=CARD_STYLE, children=[dbc.CardHeader("Temperatura"), dbc.CardBody([dcc.Graph(id='g-temp', style={'height':'200px'}), html.Div(id='s-temp', className="text-center")])])]),
-        dbc.Col(md=3, children=[dbc.Card(style=CARD_STYLE, children=[dbc.CardHeader("Luminosidade"), dbc.CardBody([dcc.Graph(id='g-ldr', style={'height':'200px'}), html.Div(id='s-ldr', className="text-center")])])]),
-        dbc.Col(md=3, children=[dbc.Card(style=CARD_STYLE, children=[dbc.CardHeader("Umidade Solo"), dbc.CardBody([dcc.Graph(id='g-hum', style={'height':'200px'}), html.Div(id='s-hum', className="text-center")])])]),
+        dbc.Col(md=3, children=[dbc.Card(style=CARD_STYLE, children=[dbc.CardHeader("Temperatura"), dbc.CardBody([dcc.Graph(id='g-temp', figure=mk_gauge(None, 10, 40, 'red'), style={'height':'200px'}), html.Div(id='s-temp', className="text-center")])])]),
+        dbc.Col(md=3, children=[dbc.Card(style=CARD_STYLE, children=[dbc.CardHeader("Luminosidade"), dbc.CardBody([dcc.Graph(id='g-ldr', figure=mk_gauge(None, 0, 4095, 'gold'), style={'height':'200px'}), html.Div(id='s-ldr', className="text-center")])])]),
+        dbc.Col(md=3, children=[dbc.Card(style=CARD_STYLE, children=[dbc.CardHeader("Umidade Solo"), dbc.CardBody([dcc.Graph(id='g-hum', figure=mk_gauge(None, 0, 100, 'deepskyblue'), style={'height':'200px'}), html.Div(id='s-hum', className="text-center")])])]),
         
         # Card Especial: Status da Iluminação Artificial
         dbc.Col(md=3, children=[dbc.Card(style=CARD_STYLE, children=[
@@ -256,8 +626,12 @@ app.layout = dbc.Container(fluid=True, style={'backgroundColor': '#111111', 'col
         ])])
     ]),
     
+    # Última leitura (escalares) compartilhada entre callbacks
+    dcc.Store(id='store'),
+    
     # Timers para atualização automática
-    dcc.Interval(id='tick', interval=2000), # Atualiza gráficos a cada 2s
+    dcc.Interval(id='tick', interval=2000), # Atualiza gauges e anexa ponto ao histórico a cada 2s
+    dcc.Interval(id='history-tick', interval=60000), # Reconstrói o histórico completo (reamostrado) a cada 1 min
     dcc.Interval(id='clock', interval=60000) # Eventos de relógio (minuto a minuto)
 ])
 
@@ -265,72 +639,158 @@ app.layout = dbc.Container(fluid=True, style={'backgroundColor': '#111111', 'col
 # CALLBACKS (Lógica Reativa)
 # =============================================================================
 
-@app.callback(
-    [Output('main-graph','figure'), Output('g-temp','figure'), Output('s-temp','children'),
-     Output('g-ldr','figure'), Output('s-ldr','children'), Output('g-hum','figure'), Output('s-hum','children'),
-     Output('led-indicator','style'), Output('light-counter','children'), Output('light-progress','value')],
-    Input('tick','n_intervals'), State('in-meta', 'value')
-)
-def update_graphs(n, meta_horas):
+LED_OFF = {'width':'50px', 'height':'50px', 'borderRadius':'50%', 'margin':'0 auto 20px auto', 'backgroundColor':'gray', 'boxShadow': 'none'}
+LED_ON = {'width':'50px', 'height':'50px', 'borderRadius':'50%', 'margin':'0 auto 20px auto', 'backgroundColor':'#00FF00', 'boxShadow': '0 0 20px #00FF00'}
+
+@app.callback(Output('main-graph','figure'), Input('history-tick','n_intervals'))
+def update_history(n):
     """
-    Callback principal: Busca dados no DB e atualiza todos os gráficos.
-    Gera gauges de tempo real e gráfico de linha histórico.
+    Recarrega os dados do gráfico histórico (carga da página e a cada history-tick).
+    Só os arrays x/y trafegam (Patch); layout e template ficam no navegador.
+    Entre recargas, os pontos novos chegam via extendData (callback client-side).
     """
     try:
-        # Busca últimos 10 minutos de dados
-        con = sqlite3.connect(DB_FILE)
-        df = pd.read_sql_query("SELECT * FROM readings WHERE timestamp > ?", con, params=(int(time.time()*1000)-600000,))
-        con.close()
+        desde = int(time.time()*1000) - JANELA_HISTORICO_MS
+        
+        # Histórico em memória (alimentado pela thread serial), direto para NumPy
+        with HIST_LOCK:
+            arr = np.array(HIST, dtype=np.float64)
         
-        df = df.dropna(subset=['temperature_c', 'umidade_percent'])
+        if len(arr):
+            arr = arr[arr[:, 0] > desde]
+            ts = arr[:, 0]
+            ldr = arr[:, 1]
+            # Linhas semeadas do banco podem já trazer o valor convertido (mesma regra do fallback abaixo)
+            temp = np.where(np.isnan(arr[:, 6]), calculate_temp_ntc_array(arr[:, 2]), arr[:, 6])
+            hum = np.where(np.isnan(arr[:, 7]), calculate_humidity_percent_array(arr[:, 3]), arr[:, 7])
+        else:
+            # Sem serial (modo visualização): busca últimos 10 minutos no banco
+            with read_lock:
+                df = pd.read_sql_query(SQL_SELECT_HISTORICO, get_read_con(), params=(desde, MAX_LINHAS_HISTORICO))
+            df = df.iloc[::-1]
+            
+            # Conversão física vetorizada. Linhas antigas já trazem o valor convertido.
+            ts = df['timestamp'].to_numpy(dtype=np.float64)
+            ldr = df['ldr_raw'].to_numpy(dtype=np.float64)
+            temp = df['temperature_c'].to_numpy(dtype=np.float64)
+            hum = df['umidade_percent'].to_numpy(dtype=np.float64)
+            temp = np.where(np.isnan(temp), calculate_temp_ntc_array(df['ntc_raw'].to_numpy(dtype=np.float64)), temp)
+            hum = np.where(np.isnan(hum), calculate_humidity_percent_array(df['umidade_raw'].to_numpy(dtype=np.float64)), hum)
         
-        # Definição de estilos visuais
-        empty_fig = go.Figure().update_layout(template="plotly_dark", paper_bgcolor='#2a2a2a', plot_bgcolor='#2a2a2a')
-        led_off = {'width':'50px', 'height':'50px', 'borderRadius':'50%', 'margin':'0 auto 20px auto', 'backgroundColor':'gray', 'boxShadow': 'none'}
-        led_on = {'width':'50px', 'height':'50px', 'borderRadius':'50%', 'margin':'0 auto 20px auto', 'backgroundColor':'#00FF00', 'boxShadow': '0 0 20px #00FF00'}
+        # Descarta leituras inválidas (NaN)
+        ok = ~(np.isnan(temp) | np.isnan(hum))
+        ts, ldr, temp, hum = ts[ok], ldr[ok], temp[ok], hum[ok]
         
-        if df.empty: return [empty_fig]*2 + ["N/A"] + [empty_fig] + ["N/A"] + [empty_fig] + ["N/A"] + [led_off] + ["0s"] + [0]
+        # Eixo de tempo como datetime64[ms] (serializado direto pelo orjson, sem objetos Python)
+        tempo = ts.astype(np.int64).astype('datetime64[ms]')
         
-        df['time'] = pd.to_datetime(df['timestamp'], unit='ms')
-        last = df.iloc[-1]
+        # No máximo MAX_PONTOS_GRAFICO por série (mesma ordem de traços de mk_history_fig)
+        fig = Patch()
+        for i, y in enumerate((temp, ldr, hum)):
+            idx = lttb_indices(ts, y, MAX_PONTOS_GRAFICO)
+            fig['data'][i]['x'] = tempo[idx]
+            fig['data'][i]['y'] = y[idx]
+        return fig
+
+    except Exception as e: 
+        print(f"Erro no Update do Histórico: {e}")
+        return dash.no_update
+
+@app.callback(Output('store','data'), Input('tick','n_intervals'), State('store','data'))
+def update_store(n, atual):
+    """
+    Callback leve do tick: publica apenas os escalares da leitura mais recente.
+    Gauges e o gráfico histórico são atualizados a partir deste Store.
+    Lê de LATEST (memória); o banco só é consultado sem serial (modo visualização).
+    Leituras mais antigas que JANELA_HISTORICO_MS (Pico parado) viram "N/A".
+    Sem leitura nova desde o último tick deste navegador, nada é atualizado.
+    """
+    desde = int(time.time()*1000) - JANELA_HISTORICO_MS
+    last = dict(LATEST)
+    if last and last['ts'] <= desde: last = {} # Leitura velha: trata como sem dados
+    
+    # Comparação com o Store do próprio cliente (cada aba tem o seu)
+    ultimo_ts = atual['t'] if atual else None
+    if last and last['ts'] == ultimo_ts: raise PreventUpdate
+    
+    try:
+        if last:
+            ts, ldr, temp_c, ntc, hum, hum_p, led, acc_luz = last['ts'], last['ldr'], None, last['ntc'], last['hum'], None, last['led'], last['acc']
+        else:
+            with read_lock:
+                row = get_read_con().execute(SQL_SELECT_ULTIMA, (desde,)).fetchone()
+            if row is None:
+                # Já em "N/A" (Store vazio): nada a redesenhar
+                if atual is None: raise PreventUpdate
+                return None
+            if row[0] == ultimo_ts: raise PreventUpdate
+            ts, ldr, temp_c, ntc, hum, hum_p, led, acc_luz = row
         
-        # Gráfico Multieixo (Temp, LDR, Umid)
-        fig = go.Figure(layout=go.Layout(template="plotly_dark", paper_bgcolor='#2a2a2a', plot_bgcolor='#2a2a2a'))
-        fig.add_trace(go.Scatter(x=df['time'], y=df['temperature_c'], name='Temp', line=dict(color='red')))
-        fig.add_trace(go.Scatter(x=df['time'], y=df['ldr_raw'], name='LDR', line=dict(color='gold'), yaxis='y2'))
-        fig.add_trace(go.Scatter(x=df['time'], y=df['umidade_percent'], name='Umid', line=dict(color='deepskyblue'), yaxis='y3'))
+        # Linhas novas trazem apenas valores crus
+        if temp_c is None and ntc is not None: temp_c = calculate_temp_ntc(ntc)
+        if hum_p is None and hum is not None: hum_p = calculate_humidity_percent(hum)
         
-        fig.update_layout(
-            yaxis=dict(title=dict(text='Temp (°C)', font=dict(color='red'))),
-            yaxis2=dict(title=dict(text='LDR', font=dict(color='gold')), overlaying='y', side='right'),
-            yaxis3=dict(title=dict(text='Umid (%)', font=dict(color='deepskyblue')), overlaying='y', side='right', position=0.95)
-        )
-
-        # Helper para criar Gauges
-        def mk_gauge(val, min_v, max_v, col):
-            return go.Figure(go.Indicator(
-                mode="gauge+number", value=val, 
-                domain={'x':[0,1], 'y':[0,1]}, 
-                gauge={'axis':{'range':[min_v,max_v]}, 'bar':{'color':'white'}, 'steps':[{'range':[min_v, max_v], 'color':col}]}
-            )).update_layout(template="plotly_dark", height=200, margin=dict(l=20, r=20, t=20, b=20), paper_bgcolor='#2a2a2a')
+        return {'t': ts, 'T': temp_c, 'LDR': ldr, 'H': hum_p, 'led': led, 'acc': acc_luz}
+    except PreventUpdate:
+        raise
+    except Exception as e: 
+        print(f"Erro no Update do Store: {e}")
+        return None
+
+# Anexa o ponto novo ao histórico no navegador, sem reenviar a figura inteira
+app.clientside_callback(
+    """
+    function(d) {
+        var gd = document.querySelector('#main-graph .js-plotly-plot');
+        if (!d || d.T === null || d.H === null || !gd || !gd.data || gd.data.length < 3) {
+            return window.dash_clientside.no_update;
+        }
+        if (gd._ultimoT !== undefined && d.t <= gd._ultimoT) {
+            return window.dash_clientside.no_update;
+        }
+        gd._ultimoT = d.t;
+        var t = new Date(d.t).toISOString().slice(0, -1);
+        return [{x: [[t], [t], [t]], y: [[d.T], [d.LDR], [d.H]]}, [0, 1, 2], %d];
+    }
+    """ % MAX_PONTOS_GRAFICO,
+    Output('main-graph','extendData'), Input('store','data')
+)
+
+@app.callback(
+    [Output('g-temp','figure'), Output('s-temp','children'),
+     Output('g-ldr','figure'), Output('s-ldr','children'), Output('g-hum','figure'), Output('s-hum','children'),
+     Output('led-indicator','style'), Output('light-counter','children'), Output('light-progress','value')],
+    Input('store','data'), State('in-meta', 'value')
+)
+def update_gauges(d, meta_horas):
+    """
+    Atualiza gauges e indicadores de luz a partir da leitura mais recente (Store).
+    Os gauges recebem apenas o novo valor (Patch), não a figura inteira.
+    """
+    # Patch que troca só o valor do Indicator
+    def gauge_val(val):
+        p = Patch()
+        p['data'][0]['value'] = val
+        return p
+    
+    try:
+        if not d or d['T'] is None or d['H'] is None: return [gauge_val(None)] + ["N/A"] + [gauge_val(None)] + ["N/A"] + [gauge_val(None)] + ["N/A"] + [LED_OFF] + ["0s"] + [0]
 
         # Cálculo de Progresso de Luz
-        led_val = last['led_status'] if 'led_status' in last else 0
-        acc_luz = last['luz_acumulada_s'] if 'luz_acumulada_s' in last else 0
-        led_style = led_on if led_val == 1 else led_off
+        acc_luz = d['acc'] or 0
+        led_style = LED_ON if d['led'] == 1 else LED_OFF
         
         meta_segundos = float(meta_horas) * 3600 if meta_horas else 1
         progresso = (acc_luz / meta_segundos) * 100
         
-        return fig, \
-               mk_gauge(last['temperature_c'], 10, 40, 'red'), f"{last['temperature_c']:.1f}°C", \
-               mk_gauge(last['ldr_raw'], 0, 4095, 'gold'), f"{last['ldr_raw']}", \
-               mk_gauge(last['umidade_percent'], 0, 100, 'deepskyblue'), f"{last['umidade_percent']:.1f}%", \
+        return gauge_val(d['T']), f"{d['T']:.1f}°C", \
+               gauge_val(d['LDR']), f"{d['LDR']}", \
+               gauge_val(d['H']), f"{d['H']:.1f}%", \
                led_style, f"{acc_luz}s / {int(meta_segundos)}s", progresso
 
     except Exception as e: 
         print(f"Erro no Update de Gráficos: {e}")
-        return [go.Figure()]*2 + ["Err"] + [go.Figure()] + ["Err"] + [go.Figure()] + ["Err"] + [{'backgroundColor':'red'}] + ["Err"] + [0]
+        return [dash.no_update] + ["Err"] + [dash.no_update] + ["Err"] + [dash.no_update] + ["Err"] + [{'backgroundColor':'red'}] + ["Err"] + [0]
 
 @app.callback(
     [Output('out-api','children'), Output('in-hum','value'), Output('in-temp','value'), Output('in-meta','value')],
@@ -340,16 +800,22 @@ def ask_api(n, plant):
     """
     Integração com LLM: Pede JSON estruturado ao Gemini com parâmetros ideais.
     Preenche automaticamente os inputs do usuário.
+    Respostas ficam em cache por planta (IA_CACHE_TTL_SEG).
     """
     if not plant: return "Digite uma planta", dash.no_update, dash.no_update, dash.no_update
     
     prompt = f"""Dados para {plant}: JSON {{ "umidade_ideal_percent": float, "temperatura_ideal_celsius": float, "fotoperiodo_horas": float, "descricao": string }}"""
+    key = plant.strip().lower()
     
     try:
-        if model:
+        data = ia_cache_get(key)
+        if data is None and model:
             resp = model.generate_content(prompt)
-            data = json.loads(resp.text.replace("```json","").replace("```",""))
-            
+            data = json_loads(IA_FENCE.sub('', resp.text).strip())
+            # Só guarda respostas completas
+            if all(k in data for k in IA_CAMPOS): ia_cache_put(key, data)
+        
+        if data is not None:
             return [html.H5("Sugestão da IA:"), html.P(data['descricao']), html.Hr(), "Valores sugeridos aplicados nos campos!"], \
                    data['umidade_ideal_percent'], \
                    data['temperatura_ideal_celsius'], \
@@ -366,44 +832,61 @@ def ask_api(n, plant):
 )
 def apply_settings(n, h, t, m):
     """
-    Envia comandos via Serial para o Microcontrolador.
+    Envia comandos via Serial para o Microcontrolador (através de TX_Q).
     Protocolo textual: SET,TIPO,VALOR
+    Falhas de escrita anteriores (thread de escrita) são informadas junto com a confirmação.
     """
     global ser
     if ser and ser.is_open:
         try:
             # Converte valores físicos para RAW antes de enviar
-            cmd_hum = f"SET,HUMID,{calculate_humidity_setpoint_raw(float(h))}\n"
-            cmd_temp = f"SET,TEMP,{calculate_temp_setpoint_raw(float(t))}\n"
-            cmd_ldr = f"SET,LDR,{LDR_LIMIAR_FIXO}\n"
-            cmd_meta = f"SET,META_LUZ,{int(float(m)*3600)}\n"
+            cmd_hum = f"SET,HUMID,{calculate_humidity_setpoint_raw(float(h))}"
+            cmd_temp = f"SET,TEMP,{calculate_temp_setpoint_raw(float(t))}"
+            cmd_ldr = f"SET,LDR,{LDR_LIMIAR_FIXO}"
+            cmd_meta = f"SET,META_LUZ,{int(float(m)*3600)}"
             
-            ser.write(cmd_hum.encode()); time.sleep(0.1)
-            ser.write(cmd_temp.encode()); time.sleep(0.1)
-            ser.write(cmd_ldr.encode()); time.sleep(0.1)
-            ser.write(cmd_meta.encode())
+            # Envio assíncrono pela thread de escrita (não bloqueia o callback)
+            for cmd in (cmd_hum, cmd_temp, cmd_ldr, cmd_meta):
+                send_command(cmd)
             
-            return dbc.Alert("Configurações enviadas com sucesso!", color="success")
+            erro = pop_tx_error()
+            if erro: return dbc.Alert(f"Configurações enfileiradas, mas o envio anterior falhou: {erro}", color="warning")
+            return dbc.Alert("Configurações enfileiradas para envio à estufa.", color="success")
         except Exception as e:
             return dbc.Alert(f"Erro ao enviar: {e}", color="danger")
     return dbc.Alert("Erro: Serial desconectada", color="danger")
 
+# Último estado enviado pelos eventos agendados (evita reenviar o mesmo comando a cada minuto)
+last_foto = None
+last_foto_envio = 0.0
+last_reset_day = None
+
 @app.callback(Output('out-apply','children', allow_duplicate=True), Input('clock','n_intervals'), prevent_initial_call=True)
 def scheduled_events(n):
     """
     Eventos agendados (Relógio).
-    Reseta o contador de luz do firmware à meia-noite.
+    Reseta o contador de luz do firmware uma vez por dia, na primeira hora.
     Controla ativação do fotoperíodo baseado na hora do servidor.
+    Os comandos só são enviados em transições (e o FOTO reafirmado a cada FOTO_REENVIO_SEG).
+    Também exibe falhas de escrita da serial ocorridas desde o último aviso.
     """
-    global ser
+    global ser, last_foto, last_foto_envio, last_reset_day
     if ser and ser.is_open:
         now = datetime.now()
-        # Reset diário
-        if now.hour == 0 and now.minute == 0: 
-            ser.write(b"RESET,TIMER_LUZ\n")
+        # Reset diário: uma vez por data, mesmo que nenhum tick caia exatamente em 00:00
+        if now.hour == 0 and now.date() != last_reset_day: 
+            send_command("RESET,TIMER_LUZ")
+            last_reset_day = now.date()
         
-        # Habilita fotoperíodo entre 01:00 e 23:00 (Exemplo)
-        ser.write(b"SET,FOTO,1\n" if 1 <= now.hour < 23 else b"SET,FOTO,0\n")
+        # Habilita fotoperíodo entre 01:00 e 23:00 (Exemplo).
+        # Reenvio periódico cobre um reinício do Pico (firmware volta com FOTO desligado).
+        desired = 1 if 1 <= now.hour < 23 else 0
+        if desired != last_foto or time.monotonic() - last_foto_envio >= FOTO_REENVIO_SEG:
+            send_command(f"SET,FOTO,{desired}")
+            last_foto, last_foto_envio = desired, time.monotonic()
+    
+    erro = pop_tx_error()
+    if erro: return dbc.Alert(f"Erro ao enviar comandos à estufa: {erro}", color="danger")
     return dash.no_update
 
 # =============================================================================
@@ -414,21 +897,34 @@ ser = None
 # Silencia logs desnecessários do servidor Flask interno
 log = logging.getLogger('werkzeug'); log.setLevel(logging.ERROR)
 
+# Log da Serial (estufa.rx e estufa.tx): arquivo rotativo (até 3 x 1 MB) e avisos/erros também no console.
+# Use RX_LOG_LEVEL = logging.DEBUG para registrar cada pacote recebido.
+RX_LOG_FILE = 'estufa_rx.log'
+RX_LOG_LEVEL = logging.INFO
+rx_log.setLevel(RX_LOG_LEVEL)
+
 if __name__ == '__main__':
     print(">>> Inicializando Sistema da Estufa...")
+    rx_file_handler = logging.handlers.RotatingFileHandler(RX_LOG_FILE, maxBytes=1_000_000, backupCount=3, encoding='utf-8')
+    rx_file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    rx_console_handler = logging.StreamHandler()
+    rx_console_handler.setLevel(logging.WARNING)
+    estufa_log = logging.getLogger('estufa')
+    estufa_log.addHandler(rx_file_handler); estufa_log.addHandler(rx_console_handler)
     init_db()
     
     # Tenta conexão serial
     try: 
-        ser = serial.Serial(COM_PORT, BAUD_RATE, timeout=2)
+        ser = serial.Serial(COM_PORT, BAUD_RATE, timeout=SERIAL_TIMEOUT_SEG)
         print(f">>> Serial conectada em {COM_PORT}")
     except: 
         print(">>> AVISO: Serial Offline (Modo de visualização apenas)")
     
-    # Inicia Thread de Leitura em Background
+    # Inicia Threads de Leitura e Escrita em Background
     if ser: 
         t = threading.Thread(target=read_from_pico, args=(ser,), daemon=True)
         t.start()
+        threading.Thread(target=write_to_pico, args=(ser,), daemon=True).start()
     
     # Inicia Servidor Web
 